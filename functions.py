@@ -2,12 +2,19 @@
 from __future__ import annotations
 
 import os
+import json
+import sys
 import time
+import random
+import threading
 import shutil
 from contextlib import contextmanager
-from dataclasses import dataclass, field
-from typing import Any, Callable, Iterable, List, Optional, Tuple, Dict
-from logging import Logger
+from dataclasses import dataclass, field, replace
+from functools import lru_cache, partial, wraps
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional, Tuple, Dict, Union
+from logging import Logger, getLogger
 
 from selenium import webdriver
 from selenium.webdriver.firefox.service import Service as FFService
@@ -15,46 +22,76 @@ from selenium.webdriver.firefox.options import Options as FFOptions
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.remote.webelement import WebElement
 from selenium.common.exceptions import (
     StaleElementReferenceException,
     ElementClickInterceptedException,
     ElementNotInteractableException,
     TimeoutException,
     NoSuchElementException,
+    WebDriverException,
 )
 
+try:
+    # Opcional (solo Linux): notificaciones del kernel para wait_for_download
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+try:
+    # Opcional (multiplataforma): eventos del sistema de archivos vía watchdog
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+
 # -------------------------------------------------------------------
 # MODELOS
 # -------------------------------------------------------------------
 
-@dataclass(frozen=True)
+# Intervalo de sondeo por defecto de las esperas (Selenium usa 0.5s)
+POLL_FREQUENCY: float = 0.1
+
+
+@dataclass(frozen=True, slots=True)
 class ScrapingAction:
     action_type: str
     description: str
     locator_by: Optional[By] = None
-    locator_path: Optional[str] = None
+    locator_path: Optional[Union[str, Dict[str, str]]] = None  # dict en form_fill/batch_extract
     timeout: int = 30
     target_element: Any = None
     keys_to_send: Optional[str] = None
+    poll_frequency: float = POLL_FREQUENCY  # ej: 0.05 para teclas, 0.5 para cargas de página
+    # (by, path) precalculado una vez; es lo que reciben _wait y las EC
+    locator: Tuple[Optional[By], Optional[str]] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "locator", (self.locator_by, self.locator_path))
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DriverState:
     driver: webdriver.Firefox
     scope: Optional[Any] = None
     last: Optional[Any] = None
     warnings: Tuple[str, ...] = field(default_factory=tuple)
+    # (by, path, WebElement) del último wait_visible, para no volver a buscarlo en la acción siguiente
+    last_element: Optional[Tuple[By, str, WebElement]] = None
+    # Valores extraídos en el flujo ({nombre: valor}); sobreviven a los clicks que pisan last
+    extracted: Dict[str, Any] = field(default_factory=dict, compare=False)
 
     def with_updates(self, **updates) -> "DriverState":
-        return DriverState(
-            driver=updates.get("driver", self.driver),
-            scope=updates.get("scope", self.scope),
-            last=updates.get("last", self.last),
-            warnings=tuple(updates.get("warnings", self.warnings)),
-        )
+        # Si nada cambia se devuelve el mismo estado, sin asignar uno nuevo
+        if all(getattr(self, name) is value for name, value in updates.items()):
+            return self
+        # Solo se convierte warnings si llega como lista; la tupla actual se comparte tal cual
+        if "warnings" in updates and not isinstance(updates["warnings"], tuple):
+            updates["warnings"] = tuple(updates["warnings"])
+        return replace(self, **updates)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ScrapingResult:
     duration: float
     successful: bool
@@ -66,6 +103,17 @@ class ScrapingResult:
 Step = Callable[[DriverState, Logger], DriverState]
 
 
+class StepOutcome(NamedTuple):
+    ok: bool
+    err: Optional[str]
+    state: DriverState
+
+
+class CompiledBlock(NamedTuple):
+    """Bloque precompilado: un Step por acción (o un solo Step si va en JS)."""
+    steps: Tuple[Step, ...]
+
+
 # -------------------------------------------------------------------
 # PIPELINE FUNCIONAL
 # -------------------------------------------------------------------
@@ -80,49 +128,237 @@ def pipe(state: DriverState, *steps: Step, logger: Logger) -> DriverState:
 # CONTEXT MANAGER: DRIVER FIREFOX
 # -------------------------------------------------------------------
 
-@contextmanager
-def firefox_driver(
-    logger: Logger,
-    driver_path: str = "geckodriver",
-    download_folder: Optional[str] = None,
-) -> Iterable[webdriver.Firefox]:
-    if not os.path.isabs(driver_path):
-        driver_path = os.path.join(os.getcwd(), driver_path)
-    if download_folder is not None and not os.path.isabs(download_folder):
-        download_folder = os.path.join(os.getcwd(), download_folder)
+# Tipos que Firefox guarda directo en disco, sin preguntar
+_NEVER_ASK_MIMES = frozenset({
+    "application/zip",
+    "application/pdf",
+    "application/octet-stream",
+    "application/vnd.ms-excel",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "text/csv",
+    "application/x-gzip",
+})
+
+
+# Preferencias fijas de cada sesión; solo la carpeta de descarga y los MIME extra varían
+_FF_PREFS: Dict[str, Any] = {
+    "network.http.http3.enabled": False,
+    "security.tls.version.min": 1,
+    "security.tls.version.max": 4,
+    "dom.disable_beforeunload": True,
+    "dom.disable_open_during_load": False,
+    "browser.link.open_newwindow": 1,
+    "browser.link.open_newwindow.restriction": 0,
+    "browser.download.folderList": 2,
+    "browser.download.useDownloadDir": True,
+    "browser.download.manager.showWhenStarting": False,
+    "browser.download.manager.useWindow": False,
+    "browser.download.manager.closeWhenDone": True,
+    "browser.helperApps.neverAsk.saveToDisk": ",".join(sorted(_NEVER_ASK_MIMES)),
+    "pdfjs.disabled": True,
+    "browser.download.start_downloads_in_tmp_dir": False,
+    # Cache solo en memoria (sin doble escritura cache + descarga), con tope de 64 MB,
+    # y sessionstore cada 30 min
+    "browser.cache.disk.enable": False,
+    "browser.cache.memory.enable": True,
+    "browser.cache.memory.capacity": 65536,
+    "browser.sessionstore.interval": 1800000,
+    # Sin imágenes, autoplay ni plugins y con tope al heap de JS. El CSS se deja activo:
+    # las esperas de visibilidad/clickable dependen del layout.
+    "permissions.default.image": 2,
+    "media.autoplay.default": 5,
+    "dom.ipc.plugins.enabled": False,
+    "javascript.options.mem.max": 262144,
+    # Un solo proceso de contenido y poco historial por pestaña (menos RAM por sesión)
+    "dom.ipc.processCount": 1,
+    "browser.sessionhistory.max_entries": 3,
+}
+
+
+_SCRIPT_TIMEOUT_MS = 600_000
 
+
+def _firefox_options(
+    logger: Logger,
+    download_folder: Optional[str],
+    headless: bool,
+    extra_mimes: Iterable[str],
+    page_load_strategy: str = "eager",
+) -> FFOptions:
     options = FFOptions()
-    options.set_preference("network.http.http3.enabled", False)
-    options.set_preference("security.tls.version.min", 1)
-    options.set_preference("security.tls.version.max", 4)
-    options.set_preference("dom.disable_beforeunload", True)
-    options.set_preference("dom.disable_open_during_load", False)
-    options.set_preference("browser.link.open_newwindow", 1)
-    options.set_preference("browser.link.open_newwindow.restriction", 0)
+    # "eager": driver.get vuelve en DOMContentLoaded, sin esperar imágenes/trackers;
+    # las esperas de cada acción ya garantizan que el elemento está listo
+    options.page_load_strategy = page_load_strategy
+    # Red de seguridad de los execute_async_script (js_block, teclado, js_kit): cada script
+    # corta solo con sus propios timeouts, así que se fija una vez por sesión y no por llamada
+    options.timeouts = {"script": _SCRIPT_TIMEOUT_MS}
+    for name, value in _FF_PREFS.items():
+        options.set_preference(name, value)
 
     if download_folder is not None:
+        if not os.path.isabs(download_folder):
+            download_folder = os.path.join(os.getcwd(), download_folder)
         os.makedirs(download_folder, exist_ok=True)
-        logger.info(f"Download folder: {download_folder}")
+        logger.info("Download folder: %s", download_folder)
         options.set_preference("browser.download.dir", download_folder)
-    options.set_preference("browser.download.folderList", 2)
-    options.set_preference(
-        "browser.helperApps.neverAsk.saveToDisk",
-        "application/zip,application/pdf",
-    )
-    options.set_preference("pdfjs.disabled", True)
+    if extra_mimes:
+        options.set_preference(
+            "browser.helperApps.neverAsk.saveToDisk",
+            ",".join(sorted(_NEVER_ASK_MIMES.union(extra_mimes))),
+        )
+
+    if headless:
+        options.add_argument("--headless")
+    return options
+
+
+# geckodriver < 0.21 cierra la conexión TCP después de cada comando (sin keep-alive)
+_MIN_GECKODRIVER = (0, 21, 0)
+# Una sesión manda los comandos en serie: con pocas conexiones vivas alcanza
+_HTTP_POOL_SIZE = 4
+
+
+def _tune_connection(driver: Any, logger: Logger) -> None:
+    """
+    Ajusta el pool HTTP del command_executor (urllib3) para reutilizar conexiones
+    al geckodriver y avisa si la versión de geckodriver no respeta keep-alive.
+    Se dejan los reintentos por defecto de urllib3: no reenvían un POST tras un error de lectura.
+    """
+    pool = getattr(driver.command_executor, "_conn", None)
+    if pool is not None:
+        pool.connection_pool_kw.update(maxsize=_HTTP_POOL_SIZE, block=False)
+        pool.clear()  # el próximo comando abre el pool con la nueva configuración
+
+    version = driver.capabilities.get("moz:geckodriverVersion") or ""
+    try:
+        parsed = tuple(int(part) for part in version.split(".")[:3])
+    except ValueError:
+        parsed = ()
+    if parsed < _MIN_GECKODRIVER:
+        logger.warning(
+            "geckodriver %s no reutiliza conexiones; se recomienda >= %s",
+            version or "desconocido",
+            ".".join(map(str, _MIN_GECKODRIVER)),
+        )
+
+
+def _launch_local(driver_path: str, options: FFOptions, logger: Logger) -> webdriver.Firefox:
+    if not os.path.isabs(driver_path):
+        driver_path = os.path.join(os.getcwd(), driver_path)
+    service = FFService(driver_path)
+    driver = webdriver.Firefox(service=service, options=options, keep_alive=True)
+    _tune_connection(driver, logger)
+    return driver
+
+
+@contextmanager
+def remote_driver(
+    logger: Logger,
+    command_executor: str,
+    download_folder: Optional[str] = None,
+    headless: bool = True,
+    extra_mimes: Iterable[str] = (),
+    capabilities: Optional[Dict[str, Any]] = None,
+    page_load_strategy: str = "eager",
+) -> Iterable[webdriver.Remote]:
+    """
+    Abre una sesión contra un geckodriver que ya está corriendo (ej: http://127.0.0.1:4444),
+    sin lanzar un proceso nuevo. Las conexiones HTTP al servidor se reutilizan (keep-alive).
+    """
+    options = _firefox_options(logger, download_folder, headless, extra_mimes, page_load_strategy)
+    for name, value in (capabilities or {}).items():
+        options.set_capability(name, value)
+    driver = webdriver.Remote(command_executor=command_executor, options=options, keep_alive=True)
+    _tune_connection(driver, logger)
+    logger.info("Firefox Selenium driver remoto iniciado (%s)", command_executor)
 
-    # headless_mode = os.getenv("HEADLESS_MODE", "true").lower() == "true"
-    # if headless_mode:
-    #     options.add_argument("--headless")
+    try:
+        yield driver
+    finally:
+        driver.quit()
+        _waiter.cache_clear()
+        logger.info("Firefox Selenium driver remoto cerrado")
 
+
+@contextmanager
+def geckodriver_service(logger: Logger, driver_path: str = "geckodriver") -> Iterable[str]:
+    """
+    Lanza geckodriver una sola vez y devuelve su URL. Las sesiones se abren y cierran
+    contra él con firefox_session, sin volver a pagar el arranque del proceso.
+    geckodriver atiende UNA sesión a la vez: las sesiones van en serie.
+    Si GECKODRIVER_URL está definida, devuelve esa URL sin lanzar nada.
+    """
+    remote_url = os.getenv("GECKODRIVER_URL")
+    if remote_url:
+        logger.info("geckodriver externo (%s)", remote_url)
+        yield remote_url
+        return
+
+    if not os.path.isabs(driver_path):
+        driver_path = os.path.join(os.getcwd(), driver_path)
     service = FFService(driver_path)
-    driver = webdriver.Firefox(service=service, options=options)
+    service.start()
+    logger.info("geckodriver iniciado (%s)", service.service_url)
+
+    try:
+        yield service.service_url
+    finally:
+        service.stop()
+        logger.info("geckodriver detenido")
+
+
+@contextmanager
+def firefox_session(
+    logger: Logger,
+    service_url: str,
+    download_folder: Optional[str] = None,
+    headless: bool = True,
+    extra_mimes: Iterable[str] = (),
+    page_load_strategy: str = "eager",
+) -> Iterable[webdriver.Remote]:
+    """
+    Sesión nueva (perfil temporal limpio) contra el geckodriver de geckodriver_service.
+    """
+    with remote_driver(
+        logger, service_url, download_folder, headless, extra_mimes,
+        page_load_strategy=page_load_strategy,
+    ) as driver:
+        yield driver
+
+
+@contextmanager
+def firefox_driver(
+    logger: Logger,
+    driver_path: str = "geckodriver",
+    download_folder: Optional[str] = None,
+    headless: bool = True,
+    extra_mimes: Iterable[str] = (),
+    page_load_strategy: str = "eager",
+) -> Iterable[webdriver.Firefox]:
+    """
+    Lanza geckodriver + Firefox locales. Si GECKODRIVER_URL está definida,
+    abre la sesión contra ese geckodriver en lugar de lanzar uno nuevo
+    (atiende una sola sesión: no abrir dos firefox_driver a la vez contra él).
+    page_load_strategy="normal" si algún flujo necesita la página cargada por completo.
+    """
+    remote_url = os.getenv("GECKODRIVER_URL")
+    if remote_url:
+        with remote_driver(
+            logger, remote_url, download_folder, headless, extra_mimes,
+            page_load_strategy=page_load_strategy,
+        ) as driver:
+            yield driver
+        return
+
+    options = _firefox_options(logger, download_folder, headless, extra_mimes, page_load_strategy)
+    driver = _launch_local(driver_path, options, logger)
     logger.info("Firefox Selenium driver iniciado")
 
     try:
         yield driver
     finally:
         driver.quit()
+        _waiter.cache_clear()  # no retener waits (ni el driver) de una sesión cerrada
         logger.info("Firefox Selenium driver cerrado")
 
 
@@ -130,34 +366,54 @@ def firefox_driver(
 # DECORADOR DE REINTENTOS
 # -------------------------------------------------------------------
 
+# Errores transientes típicos de Selenium que with_retries reintenta por defecto
+_RETRY_ON: Tuple[type, ...] = (
+    StaleElementReferenceException,
+    ElementClickInterceptedException,
+    ElementNotInteractableException,
+    TimeoutException,
+    NoSuchElementException,
+)
+
+
+class KeyboardIncompleteException(WebDriverException):
+    """El teclado virtual quedó con parte de la contraseña pulsada."""
+
+
+def _backoff(attempt: int, base_delay: float, max_delay: float, jitter: float) -> float:
+    return min(max_delay, base_delay * (2 ** (attempt - 1))) * random.uniform(1 - jitter, 1 + jitter)
+
+
 def with_retries(
     attempts: int = 4,
     base_delay: float = 0.6,
-    retry_on: Tuple[type, ...] = (
-        StaleElementReferenceException,
-        ElementClickInterceptedException,
-        ElementNotInteractableException,
-        TimeoutException,
-        NoSuchElementException,
-    ),
+    max_delay: float = 3.0,
+    jitter: float = 0.5,
+    retry_on: Tuple[type, ...] = _RETRY_ON,
 ) -> Callable[[Step], Step]:
     """
     Reintenta un Step ante errores transientes típicos de Selenium.
-    Usa backoff exponencial: base_delay * (2 ** (intento - 1)).
+    Los argumentos extra (p.ej. la ScrapingAction) se reenvían tal cual, así el decorador
+    se aplica una sola vez a nivel de módulo y las factories solo enlazan la acción.
+    Usa backoff exponencial truncado, min(base_delay * (2 ** (intento - 1)), max_delay),
+    escalado por un factor aleatorio en [1 - jitter, 1 + jitter]. No espera tras el último intento.
+    El Step sin reintentos queda en __wrapped__.
     """
     def _decorator(step_fn: Step) -> Step:
-        def _wrapped(state: DriverState, logger: Logger) -> DriverState:
+        @wraps(step_fn)
+        def _wrapped(state: DriverState, logger: Logger, *args: Any, **kwargs: Any) -> DriverState:
             last_exc: Optional[Exception] = None
             for i in range(1, attempts + 1):
                 try:
-                    return step_fn(state, logger)
+                    return step_fn(state, logger, *args, **kwargs)
                 except retry_on as e:
                     last_exc = e
                     logger.warning(
-                        f"[{step_fn.__name__}] retry {i}/{attempts}: {e.__class__.__name__}"
+                        "[%s] retry %d/%d: %s", step_fn.__name__, i, attempts, e.__class__.__name__
                     )
-                    time.sleep(base_delay * (2 ** (i - 1)))
-            logger.error(f"[{step_fn.__name__}] failed after {attempts} attempts: {last_exc}")
+                    if i < attempts:
+                        time.sleep(_backoff(i, base_delay, max_delay, jitter))
+            logger.error("[%s] failed after %d attempts: %s", step_fn.__name__, attempts, last_exc)
             raise last_exc
         return _wrapped
     return _decorator
@@ -171,30 +427,59 @@ def _ctx(state: DriverState) -> Any:
     return state.scope if state.scope is not None else state.driver
 
 
+@lru_cache(maxsize=128)
+def _waiter(context: Any, timeout: int, poll_frequency: float = POLL_FREQUENCY) -> WebDriverWait:
+    """
+    Devuelve un WebDriverWait reutilizable por (contexto, timeout, poll_frequency).
+    El contexto puede ser el driver o un WebElement (ambos son hashables).
+    """
+    return WebDriverWait(
+        context,
+        timeout,
+        poll_frequency=poll_frequency,
+        ignored_exceptions=(StaleElementReferenceException,),
+    )
+
+
+_SCROLL_JS = "arguments[0].scrollIntoView({block:'center'});"
+
+_CONDITIONS: Dict[str, Callable[[Tuple[By, str]], Callable[[Any], Any]]] = {
+    "presence": EC.presence_of_element_located,
+    "visible": EC.visibility_of_element_located,
+    "clickable": EC.element_to_be_clickable,
+}
+
+
 def _wait(
     state: DriverState,
-    by: By,
-    path: str,
+    locator: Tuple[By, str],
     timeout: int,
     cond: str = "presence",  # presence|visible|clickable
+    poll_frequency: float = POLL_FREQUENCY,
 ) -> Any:
-    context = _ctx(state)
-    wait = WebDriverWait(context, timeout)
-    locator = (by, path)
-    if cond == "visible":
-        return wait.until(EC.visibility_of_element_located(locator))
-    if cond == "clickable":
-        return wait.until(EC.element_to_be_clickable(locator))
-    return wait.until(EC.presence_of_element_located(locator))
+    wait = _waiter(_ctx(state), timeout, poll_frequency)
+    return wait.until(_CONDITIONS[cond](locator))
 
 
-def _find_all(state: DriverState, by: By, path: str) -> List[Any]:
-    parent = _ctx(state)
-    return parent.find_elements(by, path)
+def _cached_element(state: DriverState, locator: Tuple[By, str]) -> Optional[WebElement]:
+    """
+    Devuelve el elemento de state.last_element si es del mismo locator y sigue visible;
+    None si hay que buscarlo (otro locator, elemento stale u oculto).
+    """
+    cached = state.last_element
+    if cached is None or cached[:2] != locator:
+        return None
+    try:
+        return cached[2] if cached[2].is_displayed() else None
+    except StaleElementReferenceException:
+        return None
 
 
 def _update_last(state: DriverState, el: Any) -> DriverState:
-    return state.with_updates(last=el)
+    # Camino rápido del caso más común (solo cambia last): sin pasar por with_updates
+    if state.last is el:
+        return state
+    return replace(state, last=el)
 
 
 # -------------------------------------------------------------------
@@ -226,118 +511,298 @@ DOCUMENT_TYPES: Dict[str, str] = {
 # -------------------------------------------------------------------
 # STEPS BÁSICOS (TODOS CON @with_retries CUANDO APLICA)
 # -------------------------------------------------------------------
+# @with_retries se aplica una sola vez a la función privada del módulo (_wait_visible, ...);
+# la factory pública solo enlaza la acción con functools.partial.
 
 def navigate(url: str) -> Step:
     def _step(state: DriverState, logger: Logger) -> DriverState:
         state.driver.get(url)
-        logger.info(f"Navigate -> {url}")
-        return state
+        logger.info("Navigate -> %s", url)
+        return state.with_updates(last_element=None)
     return _step
 
 
-def url_to_be(url: str, timeout: int = 30) -> Step:
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        WebDriverWait(state.driver, timeout).until(EC.url_to_be(url))
-        logger.info(f"URL to be: {url}")
-        return state
-    return _step
+@with_retries()
+def _url_to_be(state: DriverState, logger: Logger, url: str, timeout: int, poll_frequency: float) -> DriverState:
+    _waiter(state.driver, timeout, poll_frequency).until(EC.url_to_be(url))
+    logger.info("URL to be: %s", url)
+    return state
+
+
+def url_to_be(url: str, timeout: int = 30, poll_frequency: float = POLL_FREQUENCY) -> Step:
+    return partial(_url_to_be, url=url, timeout=timeout, poll_frequency=poll_frequency)
+
+
+@with_retries()
+def _wait_visible(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    el = _wait(
+        state, action.locator, action.timeout,
+        cond="visible", poll_frequency=action.poll_frequency,
+    )
+    logger.info("Visible: %s", action.description)
+    return state.with_updates(last=el, last_element=(*action.locator, el))
 
 
 def wait_visible(action: ScrapingAction) -> Step:
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        el = _wait(state, action.locator_by, action.locator_path, action.timeout, cond="visible")
-        logger.info(f"Visible: {action.description}")
-        return _update_last(state, el)
-    return _step
+    return partial(_wait_visible, action=action)
+
+
+@with_retries()
+def _wait_present(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    el = _wait(
+        state, action.locator, action.timeout,
+        cond="presence", poll_frequency=action.poll_frequency,
+    )
+    logger.info("Present: %s", action.description)
+    return _update_last(state, el)
+
+
+def wait_present(action: ScrapingAction) -> Step:
+    """
+    Solo exige que el elemento esté en el DOM: evita el chequeo de visibilidad
+    (un round-trip extra por sondeo) cuando no hace falta.
+    """
+    return partial(_wait_present, action=action)
+
+
+@with_retries()
+def _wait_invisible(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    _waiter(state.driver, action.timeout, action.poll_frequency).until(
+        EC.invisibility_of_element_located(action.locator)
+    )
+    logger.info("Invisible: %s", action.description)
+    return state
 
 
 def wait_invisible(action: ScrapingAction) -> Step:
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        WebDriverWait(state.driver, action.timeout).until(
-            EC.invisibility_of_element_located((action.locator_by, action.locator_path))
+    return partial(_wait_invisible, action=action)
+
+
+@with_retries()
+def _wait_clickable(state: DriverState, logger: Logger, action: ScrapingAction, click: bool) -> DriverState:
+    # element_to_be_clickable ya devuelve el WebElement: no hace falta un find_elements extra
+    el = _cached_element(state, action.locator)
+    if el is None or not el.is_enabled():
+        el = _wait(
+            state, action.locator, action.timeout,
+            cond="clickable", poll_frequency=action.poll_frequency,
         )
-        logger.info(f"Invisible: {action.description}")
-        return state
-    return _step
+    if click:
+        try:
+            state.driver.execute_script(_SCROLL_JS, el)
+        except Exception:
+            pass
+        el.click()
+        logger.info("Click: %s", action.description)
+    else:
+        logger.info("Clickable: %s", action.description)
+    return _update_last(state, el)
 
 
 def wait_clickable(action: ScrapingAction, *, click: bool = False) -> Step:
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        _wait(state, action.locator_by, action.locator_path, action.timeout, cond="clickable")
-        els = _find_all(state, action.locator_by, action.locator_path)
-        if not els:
-            raise NoSuchElementException(f"No encontrado: {action.description}")
-        el = els[0]
-        if click:
-            try:
-                state.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
-            except Exception:
-                pass
-            el.click()
-            logger.info(f"Click: {action.description}")
-        else:
-            logger.info(f"Clickable: {action.description}")
-        return _update_last(state, el)
-    return _step
+    return partial(_wait_clickable, action=action, click=click)
+
+
+@with_retries()
+def _safe_send_keys(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    s2 = _wait_clickable(state, logger, action=action, click=False)
+    el = s2.last
+    el.clear()
+    el.send_keys(action.keys_to_send or "")
+    logger.info("Send keys: %s", action.description)
+    return s2
 
 
 def safe_send_keys(action: ScrapingAction) -> Step:
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        s2 = wait_clickable(action, click=False)(state, logger)
-        el = s2.last
-        el.clear()
-        el.send_keys(action.keys_to_send or "")
-        logger.info(f"Send keys: {action.description}")
-        return s2
-    return _step
+    return partial(_safe_send_keys, action=action)
+
+
+@with_retries()
+def _select_option_by_value(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    locator = (By.ID, action.locator_path)
+    el = _cached_element(state, locator) or _wait(
+        state, locator, action.timeout,
+        cond="visible", poll_frequency=action.poll_frequency,
+    )
+    Select(el).select_by_value(action.keys_to_send)
+    label = DOCUMENT_TYPES.get(action.keys_to_send, action.keys_to_send)
+    logger.info("Select '%s' (%s) en #%s", label, action.keys_to_send, action.locator_path)
+    return _update_last(state, el)
 
 
 def select_option_by_value(action: ScrapingAction) -> Step:
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        el = _wait(state, By.ID, action.locator_path, action.timeout, cond="visible")
-        Select(el).select_by_value(action.keys_to_send)
-        label = DOCUMENT_TYPES.get(action.keys_to_send, action.keys_to_send)
-        logger.info(f"Select '{label}' ({action.keys_to_send}) en #{action.locator_path}")
-        return _update_last(state, el)
-    return _step
+    return partial(_select_option_by_value, action=action)
+
+
+# Llena varios campos en un solo execute_script: asigna .value (en <select>, la opción
+# con ese value) y dispara input/change para que los listeners del formulario se enteren.
+# Devuelve los selectores que no encontró.
+_FORM_FILL_JS = """
+const missing = [];
+for (const [selector, value] of Object.entries(arguments[0])) {
+  const el = document.querySelector(selector);
+  if (!el) { missing.push(selector); continue; }
+  if (el.tagName === "SELECT") {
+    const idx = Array.from(el.options).findIndex((o) => o.value === value);
+    if (idx < 0) { missing.push(selector + " = " + value); continue; }
+    el.selectedIndex = idx;
+  } else {
+    el.focus();
+    el.value = value;
+  }
+  el.dispatchEvent(new Event("input", {bubbles: true}));
+  el.dispatchEvent(new Event("change", {bubbles: true}));
+}
+return missing;
+"""
+
+
+@with_retries()
+def _form_fill(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    missing = state.driver.execute_script(_FORM_FILL_JS, action.locator_path)
+    if missing:
+        raise NoSuchElementException(f"Form fill ({action.description}): no encontrado {missing}")
+    logger.info("Form fill: %s (%d campos)", action.description, len(action.locator_path))
+    return state
+
+
+def form_fill(action: ScrapingAction) -> Step:
+    """
+    locator_path es un dict {selector CSS: valor}; todos los campos se llenan en un round-trip.
+    """
+    return partial(_form_fill, action=action)
+
+
+@with_retries()
+def _switch_to_iframe(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    _waiter(state.driver, action.timeout, action.poll_frequency).until(
+        EC.frame_to_be_available_and_switch_to_it(action.locator)
+    )
+    logger.info("Iframe: %s", action.description)
+    # El last_element cacheado es del documento anterior: ya no sirve dentro del iframe
+    return state.with_updates(last_element=None)
 
 
 def switch_to_iframe(action: ScrapingAction) -> Step:
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        WebDriverWait(state.driver, action.timeout).until(
-            EC.frame_to_be_available_and_switch_to_it((action.locator_by, action.locator_path))
-        )
-        logger.info(f"Iframe: {action.description}")
-        return state
-    return _step
+    return partial(_switch_to_iframe, action=action)
 
 
 # -------------------------------------------------------------------
 # TECLADO VIRTUAL (PASSWORD)
 # -------------------------------------------------------------------
 
+@with_retries()
+def _focus_input(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    el = _wait(
+        state, action.locator, action.timeout,
+        cond="visible", poll_frequency=action.poll_frequency,
+    )
+    try:
+        # Vacía el input: si el bloque se reintenta, el teclado no suma dígitos a los anteriores
+        state.driver.execute_script(_SCROLL_JS + "arguments[0].value = '';", el)
+    except Exception:
+        pass
+    el.click()
+    logger.info("Focus input: %s", action.description)
+    return _update_last(state, el)
+
+
 def focus_input(action: ScrapingAction) -> Step:
     """
     Enfoca el input que dispara el teclado virtual (ej: #suraPassword).
     """
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        el = _wait(state, action.locator_by, action.locator_path, action.timeout, cond="visible")
+    return partial(_focus_input, action=action)
+
+
+# Locators del teclado virtual (keyset visible y botón Aceptar)
+_KEYSET_SEL = "div.ui-keyboard-keyset.ui-keyboard-keyset-default[style*='display: block']"
+_KEYSET_LOC = (By.CSS_SELECTOR, _KEYSET_SEL)
+_ACCEPT_LOC = (By.CSS_SELECTOR, "button.ui-keyboard-button.ui-keyboard-accept, button[name='accept']")
+
+
+# Helpers JS compartidos por _KEYBOARD_TYPE_JS y _VK_KIT_JS. ui-keyboard escribe en
+# mousedown (no en click), así que cada tecla recibe la secuencia de un clic nativo y se
+# confirma que el carácter llegó al campo (el preview del teclado, o el input si no hay).
+# vkTypeAll resuelve con {typed, error}; si una tecla no entra (o entra doble) deja el
+# campo como estaba y devuelve typed = 0, para que el fallback por WebDriver arranque limpio.
+_VK_TYPE_ALL_JS = """
+const vkField = (keyset, input) => {
+  const kb = keyset.closest(".ui-keyboard");
+  return (kb && kb.querySelector(".ui-keyboard-preview")) || input;
+};
+const vkTypeAll = async (keyset, field, digits) => {
+  if (!field) return {typed: 0, error: "Campo del teclado virtual no encontrado"};
+  const start = field.value;
+  let typed = 0;
+  for (const d of digits) {
+    const btn = keyset.querySelector(`button.ui-keyboard-button[data-value="${CSS.escape(d)}"]`);
+    if (!btn) return {typed, error: "Tecla no encontrada en el teclado virtual: " + d};
+    for (const type of ["mousedown", "mouseup"]) {
+      btn.dispatchEvent(new MouseEvent(type, {bubbles: true, cancelable: true, view: window, button: 0}));
+    }
+    btn.click();
+    const got = field.value.length - start.length;
+    if (got !== typed + 1) {
+      field.value = start;
+      return {typed: 0, error: `El teclado virtual registró ${got} de ${typed + 1} teclas`};
+    }
+    typed++;
+    await new Promise((r) => setTimeout(r, 20));
+  }
+  return {typed, error: null};
+};
+"""
+
+# Pulsa todas las teclas dentro del navegador, con 20ms entre clics.
+# Devuelve {typed, error}: cuántas llegaron al campo y el error (o null).
+_KEYBOARD_TYPE_JS = """
+const [keyset, digits, done] = arguments;
+""" + _VK_TYPE_ALL_JS + """
+const active = document.activeElement;
+const field = vkField(keyset, active && "value" in active ? active : null);
+vkTypeAll(keyset, field, digits).then(done, (e) => done({typed: 0, error: String(e)}));
+"""
+
+_KEY_BTN_FMT = "button.ui-keyboard-button[data-value='{}']".format
+
+
+def _click_digit(keyset: WebElement, digit: str) -> None:
+    # Fallback por WebDriver (un clic por dígito) para páginas que bloquean execute_script
+    keyset.find_element(By.CSS_SELECTOR, _KEY_BTN_FMT(digit)).click()
+    time.sleep(0.02)
+
+
+@with_retries(attempts=5, base_delay=0.5)
+def _keyboard_type_digits(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    digits = action.keys_to_send or ""  # el JS recorre el string directamente
+    if not digits:
+        return state
+
+    keyset = _waiter(state.driver, action.timeout, action.poll_frequency).until(
+        EC.visibility_of_element_located(_KEYSET_LOC)
+    )
+    # Un solo round-trip para todos los dígitos en vez de espera + clic por dígito
+    try:
+        res = state.driver.execute_async_script(_KEYBOARD_TYPE_JS, keyset, digits)
+    except WebDriverException as e:
+        res = {"typed": 0, "error": e.__class__.__name__}
+    typed = res["typed"]
+    if typed < len(digits):
+        # Sigue por clics desde donde quedó el JS (sin repetir las teclas ya pulsadas)
+        logger.warning("[keyboard] JS se detuvo en %d/%d (%s); sigue por clics", typed, len(digits), res["error"])
         try:
-            state.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
-        except Exception:
-            pass
-        el.click()
-        logger.info(f"Focus input: {action.description}")
-        return _update_last(state, el)
-    return _step
+            for d in digits[typed:]:
+                _click_digit(keyset, d)
+                typed += 1
+        except WebDriverException as e:
+            if not typed:
+                raise  # nada pulsado: el reintento del step arranca limpio
+            # Con teclas ya pulsadas, reintentar desde el dígito 0 duplicaría el PIN: este step
+            # no la reintenta, así que falla (y el bloque, o el js_kit, vuelve a enfocar y
+            # vaciar el input)
+            raise KeyboardIncompleteException(f"Teclado virtual a medias ({typed}/{len(digits)}): {e.msg}") from e
+    logger.info("[keyboard] %d teclas pulsadas", len(digits))
+    return state
 
 
 def keyboard_type_digits(action: ScrapingAction) -> Step:
@@ -346,86 +811,174 @@ def keyboard_type_digits(action: ScrapingAction) -> Step:
     - keyset visible: div.ui-keyboard-keyset.ui-keyboard-keyset-default[style*='display: block']
     - botón: button.ui-keyboard-button[data-value='X']
     """
-    @with_retries(attempts=5, base_delay=0.5)
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        keyset = WebDriverWait(state.driver, action.timeout).until(
-            EC.visibility_of_element_located((
-                By.CSS_SELECTOR,
-                "div.ui-keyboard-keyset.ui-keyboard-keyset-default[style*='display: block']"
-            ))
-        )
-        digits = list(action.keys_to_send or "")
-        if not digits:
-            return state
-
-        for d in digits:
-            btn = WebDriverWait(keyset, action.timeout).until(
-                EC.element_to_be_clickable((
-                    By.CSS_SELECTOR,
-                    f"button.ui-keyboard-button[data-value='{d}']"
-                ))
-            )
-            try:
-                state.driver.execute_script("arguments[0].scrollIntoView({block:'center'});", btn)
-            except Exception:
-                pass
-            btn.click()
-            logger.info(f"[keyboard] click '{d}'")
-            time.sleep(0.05)
+    return partial(_keyboard_type_digits, action=action)
 
-        return state
-    return _step
+
+@with_retries(attempts=5, base_delay=0.5)
+def _keyboard_accept(state: DriverState, logger: Logger, poll_frequency: float) -> DriverState:
+    keyset = _waiter(state.driver, 15, poll_frequency).until(
+        EC.visibility_of_element_located(_KEYSET_LOC)
+    )
+    accept_btn = _waiter(keyset, 10, poll_frequency).until(
+        EC.element_to_be_clickable(_ACCEPT_LOC)
+    )
+    accept_btn.click()
+    logger.info("[keyboard] Accept")
+    return state
 
 
 def keyboard_accept(action: Optional[ScrapingAction] = None) -> Step:
     """
     Pulsa el botón 'Aceptar' del teclado virtual.
     """
-    @with_retries(attempts=5, base_delay=0.5)
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        keyset = WebDriverWait(state.driver, 15).until(
-            EC.visibility_of_element_located((
-                By.CSS_SELECTOR,
-                "div.ui-keyboard-keyset.ui-keyboard-keyset-default[style*='display: block']"
-            ))
-        )
-        accept_btn = WebDriverWait(keyset, 10).until(
-            EC.element_to_be_clickable((
-                By.CSS_SELECTOR,
-                "button.ui-keyboard-button.ui-keyboard-accept, button[name='accept']"
-            ))
-        )
-        accept_btn.click()
-        logger.info("[keyboard] Accept")
+    poll_frequency = action.poll_frequency if action is not None else POLL_FREQUENCY
+    return partial(_keyboard_accept, poll_frequency=poll_frequency)
+
+
+# Rutina completa del teclado virtual dentro de la página: enfoca el input (vaciándolo),
+# espera el keyset, pulsa los dígitos y Aceptar. Queda en la página como
+# window.__suraVkType y resuelve con {typed, error}.
+_VK_KIT_JS = _VK_TYPE_ALL_JS + """
+window.__suraVkType = async (inputSel, pw, timeoutMs, pollMs) => {
+  const KEYSET = %s;
+  const ACCEPT = %s;
+  const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+  const limit = Date.now() + timeoutMs;
+  const until = async (get, what) => {
+    let found = get();
+    while (!found) {
+      if (Date.now() > limit) throw new Error("Timeout esperando " + what);
+      await sleep(pollMs);
+      found = get();
+    }
+    return found;
+  };
+  let typed = 0;
+  try {
+    const input = await until(() => document.querySelector(inputSel), inputSel);
+    input.value = "";
+    input.scrollIntoView({block: "center"});
+    input.focus();
+    input.click();
+    const keyset = await until(() => {
+      const k = document.querySelector(KEYSET);
+      return k && k.getClientRects().length > 0 ? k : null;
+    }, "teclado virtual");
+    const res = await vkTypeAll(keyset, vkField(keyset, input), pw);
+    typed = res.typed;
+    if (res.error) return res;
+    (await until(() => keyset.querySelector(ACCEPT), "botón Aceptar")).click();
+    return {typed, error: null};
+  } catch (e) {
+    return {typed, error: String(e)};
+  }
+};
+""" % (json.dumps(_KEYSET_SEL), json.dumps(_ACCEPT_LOC[1]))
+
+# Un solo execute_async_script: define la rutina si la página aún no la tiene y la llama
+_VK_CALL_JS = """
+const [inputSel, pw, timeoutMs, pollMs, done] = arguments;
+if (!window.__suraVkType) {
+""" + _VK_KIT_JS + """
+}
+window.__suraVkType(inputSel, pw, timeoutMs, pollMs).then(done);
+"""
+
+
+def _vk_type(driver: Any, action: ScrapingAction) -> Dict[str, Any]:
+    return driver.execute_async_script(
+        _VK_CALL_JS,
+        action.locator_path,
+        action.keys_to_send or "",
+        action.timeout * 1000,
+        action.poll_frequency * 1000,
+    )
+
+
+@with_retries(attempts=3, base_delay=0.5, retry_on=_RETRY_ON + (KeyboardIncompleteException,))
+def _js_kit(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    try:
+        res = _vk_type(state.driver, action)
+    except WebDriverException as e:
+        res = {"typed": 0, "error": e.__class__.__name__}
+    if not res["error"]:
+        logger.info("[js_kit] %s: %d teclas + Aceptar", action.description, res["typed"])
         return state
-    return _step
+
+    if res["typed"]:
+        # Quedaron teclas a medias: reintentar el kit (vacía el input) en vez de sumar clics
+        raise KeyboardIncompleteException(f"js_kit ({action.description}): {res['error']}")
+    logger.warning("[js_kit] %s; sigue por WebDriver", res["error"])
+    # Un intento de cada Step: los reintentos ya los pone el decorador de _js_kit
+    state = _focus_input.__wrapped__(state, logger, action=action)
+    state = _keyboard_type_digits.__wrapped__(state, logger, action=action)
+    return _keyboard_accept.__wrapped__(state, logger, poll_frequency=action.poll_frequency)
+
+
+def js_kit(action: ScrapingAction) -> Step:
+    """
+    Contraseña por teclado virtual en un solo execute_async_script: enfoca el input
+    (locator_path = selector CSS, ej: '#suraPassword'), teclea keys_to_send y acepta.
+    Si la página no deja correr la rutina, usa focus_input + keyboard_type + keyboard_accept.
+    """
+    return partial(_js_kit, action=action)
 
 # -------------------------------------------------------------------
 # EXTRACCIONES ESPECÍFICAS: CITA PENDIENTE Y TAB DE FECHA
 # -------------------------------------------------------------------
 
+# Lecturas del DOM en un solo execute_script (un round-trip en vez de uno por span/atributo).
+# innerText equivale al .text de Selenium (solo texto renderizado).
+_APPOINTMENT_SPANS_JS = """
+const s = arguments[0].querySelectorAll("span");
+return {
+  date: ((s[0] && s[0].innerText) || "").trim(),
+  time: ((s[1] && s[1].innerText) || "").trim(),
+};
+"""
+
+_TAB_LABEL_JS = """
+const e = arguments[0];
+return (e.getAttribute("aria-label") || e.innerText || "").trim();
+"""
+
+
+@with_retries()
+def _extract_first_pending_appointment(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    # Localiza el contenedor de fecha de la cita
+    el = _wait(
+        state,
+        action.locator,
+        action.timeout,
+        cond="visible",
+        poll_frequency=action.poll_frequency,
+    )
+    data = state.driver.execute_script(_APPOINTMENT_SPANS_JS, el)
+    logger.info("Cita pendiente encontrada: %s - %s", data["date"], data["time"])
+    return state.with_updates(last=data, extracted={**state.extracted, "appointment": data})
+
+
 def extract_first_pending_appointment(action: ScrapingAction) -> Step:
     """
     Toma la PRIMERA cita pendiente que encuentre (primer .tarjetaCita__fecha)
-    y guarda en state.last un dict: {"date": "...", "time": "..."}.
+    y guarda en state.last un dict: {"date": "...", "time": "..."}
+    (también en state.extracted["appointment"]).
     """
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        # Localiza el contenedor de fecha de la cita
-        el = _wait(
-            state,
-            action.locator_by,
-            action.locator_path,
-            action.timeout,
-            cond="visible",
-        )
-        spans = el.find_elements(By.CSS_SELECTOR, "span")
-        date_text = spans[0].text.strip() if len(spans) > 0 else ""
-        time_text = spans[1].text.strip() if len(spans) > 1 else ""
-        data = {"date": date_text, "time": time_text}
-        logger.info(f"Cita pendiente encontrada: {data['date']} - {data['time']}")
-        return state.with_updates(last=data)
-    return _step
+    return partial(_extract_first_pending_appointment, action=action)
+
+
+@with_retries()
+def _extract_tab_date(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    el = _wait(
+        state,
+        action.locator,
+        action.timeout,
+        cond="visible",
+        poll_frequency=action.poll_frequency,
+    )
+    label = state.driver.execute_script(_TAB_LABEL_JS, el)
+    logger.info("Fecha de tab activo: %s", label)
+    return state.with_updates(last=label, extracted={**state.extracted, "tab_date": label})
 
 
 def extract_tab_date(action: ScrapingAction) -> Step:
@@ -433,59 +986,243 @@ def extract_tab_date(action: ScrapingAction) -> Step:
     Lee la fecha del TAB activo de reprogramación.
     - Primero intenta aria-label (ej: '2025-11-15')
     - Si no hay, usa el texto visible del tab.
-    Guarda en state.last un string.
+    Guarda en state.last un string (también en state.extracted["tab_date"]).
     """
-    @with_retries()
-    def _step(state: DriverState, logger: Logger) -> DriverState:
-        el = _wait(
-            state,
-            action.locator_by,
-            action.locator_path,
-            action.timeout,
-            cond="visible",
-        )
-        label = el.get_attribute("aria-label") or el.text
-        label = label.strip()
-        logger.info(f"Fecha de tab activo: {label}")
-        return state.with_updates(last=label)
-    return _step
+    return partial(_extract_tab_date, action=action)
+
+
+_BATCH_EXTRACT_JS = """
+const out = {};
+for (const [name, selector] of Object.entries(arguments[0])) {
+  const e = document.querySelector(selector);
+  out[name] = e ? (e.getAttribute("aria-label") || e.innerText || "").trim() : null;
+}
+return out;
+"""
+
+
+@with_retries()
+def _batch_extract(state: DriverState, logger: Logger, action: ScrapingAction) -> DriverState:
+    selectors = action.locator_path
+    # El primer selector marca que la pantalla ya cargó; el resto debe existir ya
+    _wait(
+        state,
+        (By.CSS_SELECTOR, next(iter(selectors.values()))),
+        action.timeout,
+        cond="visible",
+        poll_frequency=action.poll_frequency,
+    )
+    data = state.driver.execute_script(_BATCH_EXTRACT_JS, selectors)
+    missing = [name for name, value in data.items() if value is None]
+    if missing:
+        raise NoSuchElementException(f"Extracción ({action.description}): no encontrado {missing}")
+    logger.info("Extracción (%s): %s", action.description, data)
+    extracted = {**state.extracted, **data}
+    return state.with_updates(last=extracted, extracted=extracted)
+
+
+def batch_extract(action: ScrapingAction) -> Step:
+    """
+    locator_path es un dict {nombre: selector CSS}. Espera a que el PRIMER selector sea
+    visible y lee todos en un solo execute_script (aria-label o texto visible).
+    Un selector que no existe es un error (se reintenta), no un None.
+    Guarda en state.last TODO lo extraído hasta ahora: state.extracted + {nombre: valor}.
+    """
+    return partial(_batch_extract, action=action)
 
 
 # -------------------------------------------------------------------
 # MAPEADOR DE ACTION_TYPE -> STEP
 # -------------------------------------------------------------------
 
+ACTION_DISPATCH: Dict[str, Callable[[ScrapingAction], Step]] = {
+    "wait_visible": wait_visible,
+    "wait_present": wait_present,
+    "wait_invisible": wait_invisible,
+    "click": lambda action: wait_clickable(action, click=True),
+    "safe_send_keys": safe_send_keys,
+    "switch_to_iframe": switch_to_iframe,
+    "select_option": select_option_by_value,
+    "form_fill": form_fill,
+    "focus_input": focus_input,
+    "keyboard_type": keyboard_type_digits,
+    "keyboard_accept": keyboard_accept,
+    "js_kit": js_kit,
+    "extract_appointment_date": extract_first_pending_appointment,
+    "extract_tab_date": extract_tab_date,
+    "batch_extract": batch_extract,
+}
+
+
+def _build_step(action: ScrapingAction) -> Step:
+    try:
+        factory = ACTION_DISPATCH[action.action_type]
+    except KeyError:
+        raise ValueError(f"Action type no soportado: {action.action_type}") from None
+    return factory(action)
+
+
+@lru_cache(maxsize=256)
+def _cached_step(action: ScrapingAction) -> Step:
+    return _build_step(action)
+
+
 def step_from_action(action: ScrapingAction) -> Step:
-    at = action.action_type
-    if at == "wait_visible":
-        return wait_visible(action)
-    if at == "wait_invisible":
-        return wait_invisible(action)
-    if at == "click":
-        return wait_clickable(action, click=True)
-    if at == "safe_send_keys":
-        return safe_send_keys(action)
-    if at == "switch_to_iframe":
-        return switch_to_iframe(action)
-    if at == "select_option":
-        return select_option_by_value(action)
-    if at == "focus_input":
-        return focus_input(action)
-    if at == "keyboard_type":
-        return keyboard_type_digits(action)
-    if at == "keyboard_accept":
-        return keyboard_accept(action)
-    if at == "extract_appointment_date":
-        return extract_first_pending_appointment(action)
-    if at == "extract_tab_date":
-        return extract_tab_date(action)
-    raise ValueError(f"Action type no soportado: {at}")
+    """
+    Devuelve el Step de una acción. ScrapingAction es frozen, así que la misma acción
+    (p.ej. al reintentar un bloque o repetirlo en un loop) reutiliza el Step ya construido.
+    """
+    try:
+        hash(action)
+    except TypeError:
+        # Algún campo no es hashable (p.ej. target_element): se construye sin cache
+        return _build_step(action)
+    return _cached_step(action)
+
+
+# -------------------------------------------------------------------
+# BLOQUE COMPLETO EN UN SOLO execute_async_script
+# -------------------------------------------------------------------
+
+# Acciones que se pueden resolver dentro del navegador sin cambiar de contexto
+JS_SAFE_ACTIONS = frozenset({"wait_present", "wait_visible", "click", "safe_send_keys", "select_option"})
+
+# Interpreta el programa de compile_block_to_js: espera cada elemento (presente para
+# wait_present; visible y, salvo wait_visible, habilitado para el resto), aplica la
+# operación y devuelve todos los elementos al final.
+_BLOCK_JS = """
+const [ops, done] = arguments;
+const find = (op) => {
+  if (op.by === "id") return document.getElementById(op.path);
+  if (op.by === "xpath") {
+    return document.evaluate(op.path, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+  }
+  return document.querySelector(op.path);
+};
+const ready = (el, op) => op.kind === "wait_present" ? !!el :
+  !!el && el.getClientRects().length > 0 && getComputedStyle(el).visibility !== "hidden"
+  && (op.kind === "wait_visible" || !el.disabled);
+const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+(async () => {
+  const elements = [];
+  for (const op of ops) {
+    const limit = Date.now() + op.timeout * 1000;
+    let el = find(op);
+    while (!ready(el, op)) {
+      if (Date.now() > limit) {
+        done({error: "Timeout esperando: " + op.description});
+        return;
+      }
+      await sleep(op.poll * 1000);
+      el = find(op);
+    }
+    if (op.kind === "click") {
+      el.scrollIntoView({block: "center"});
+      el.click();
+    } else if (op.kind === "safe_send_keys" || op.kind === "select_option") {
+      el.value = op.value;
+      el.dispatchEvent(new Event("input", {bubbles: true}));
+      el.dispatchEvent(new Event("change", {bubbles: true}));
+    }
+    elements.push(el);
+  }
+  done({elements: elements});
+})().catch((e) => done({error: String(e)}));
+"""
+
+
+def compile_block_to_js(actions: List[ScrapingAction]) -> List[Dict[str, Any]]:
+    """
+    Traduce un bloque de acciones JS-safe al programa que ejecuta _BLOCK_JS.
+    Lanza ValueError si alguna acción necesita pasar por Selenium.
+    """
+    program = []
+    for act in actions:
+        if act.action_type not in JS_SAFE_ACTIONS:
+            raise ValueError(f"Action type no soportado en JS: {act.action_type}")
+        # select_option siempre localiza por ID (igual que select_option_by_value)
+        by = By.ID if act.action_type == "select_option" else act.locator_by
+        if by not in (By.ID, By.XPATH, By.CSS_SELECTOR):
+            raise ValueError(f"Locator no soportado en JS: {by}")
+        program.append({
+            "kind": act.action_type,
+            "description": act.description,
+            "by": by,
+            "path": act.locator_path,
+            "timeout": act.timeout,
+            "value": act.keys_to_send or "",
+            "poll": act.poll_frequency,
+        })
+    return program
+
+
+def is_js_batchable(actions: List[ScrapingAction]) -> bool:
+    return bool(actions) and all(
+        act.action_type in JS_SAFE_ACTIONS
+        and (act.action_type == "select_option" or act.locator_by in (By.ID, By.XPATH, By.CSS_SELECTOR))
+        for act in actions
+    )
+
+
+def js_block(actions: List[ScrapingAction]) -> Step:
+    """
+    Ejecuta todo el bloque en el navegador con un único round-trip a geckodriver.
+    Sin @with_retries: los reintentos los hace run_block a nivel de bloque.
+    """
+    program = compile_block_to_js(actions)
+
+    def _step(state: DriverState, logger: Logger) -> DriverState:
+        res = state.driver.execute_async_script(_BLOCK_JS, program)
+        if res.get("error"):
+            raise TimeoutException(res["error"])
+        logger.info("Bloque JS: %d acciones en un solo round-trip", len(program))
+        return _update_last(state, res["elements"][-1])
+    return _step
 
 
 # -------------------------------------------------------------------
 # EJECUCIÓN DE BLOQUES (run_block)
 # -------------------------------------------------------------------
 
+def _wait_document_ready(driver: Any, timeout: float, poll: float = 0.2) -> None:
+    """
+    Sondea document.readyState cada `poll` segundos hasta 'complete' o hasta `timeout`.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if driver.execute_script("return document.readyState") == "complete":
+                return
+        except Exception:
+            pass
+        time.sleep(poll)
+
+
+def compile_actions(actions: List[ScrapingAction], batch_js: bool = False) -> CompiledBlock:
+    """
+    Arma una vez los Steps de un bloque,
+    para que los reintentos de run_block no vuelvan a recorrer las acciones.
+    """
+    if batch_js and is_js_batchable(actions):
+        steps = (js_block(actions),)
+    else:
+        steps = tuple(step_from_action(act) for act in actions)
+    return CompiledBlock(steps=steps)
+
+
+def _run_steps(state: DriverState, steps: Iterable[Step], logger: Logger) -> StepOutcome:
+    """
+    Ejecuta los Steps en orden y se detiene en el primero que falla (tras sus reintentos).
+    Un solo try por intento de bloque; el resultado se devuelve como valor, no como excepción.
+    """
+    try:
+        for step in steps:
+            state = step(state, logger)
+    except Exception as e:
+        return StepOutcome(ok=False, err=str(e), state=state)
+    return StepOutcome(ok=True, err=None, state=state)
+
+
 def run_block(
     state: DriverState,
     actions: List[ScrapingAction],
@@ -493,39 +1230,46 @@ def run_block(
     before_retry_block: Optional[Callable[[], None]] = None,
     attempts: int = 3,
     delay: float = 5.0,
+    batch_js: bool = False,
+    max_delay: float = 10.0,
+    jitter: float = 0.2,
 ) -> Tuple[DriverState, ScrapingResult]:
     """
     Ejecuta una lista de ScrapingAction como un bloque.
     - Si algún Step lanza excepción después de sus reintentos internos, reintenta TODO el bloque.
+    - Entre intentos espera a que document.readyState sea 'complete', como mucho el backoff
+      (delay, 2*delay, ... hasta max_delay, con jitter) en vez de dormir siempre delay.
+    - Con batch_js=True y todas las acciones JS-safe, el bloque corre en un solo execute_async_script.
     """
-    start = time.time()
+    start = time.monotonic_ns()
     last_state = state
     last_error: Optional[str] = None
     ok = True
+    # Los Steps se arman una vez; los reintentos del bloque los reutilizan
+    steps = compile_actions(actions, batch_js=batch_js).steps
 
     for i in range(1, attempts + 1):
-        try:
-            s = last_state
-            for act in actions:
-                step = step_from_action(act)
-                s = step(s, logger)
-            last_state = s
+        outcome = _run_steps(last_state, steps, logger)
+        if outcome.ok:
+            last_state = outcome.state
             ok = True
             last_error = None
             break
-        except Exception as e:
-            ok = False
-            last_error = str(e)
-            logger.error(f"[run_block retry {i}/{attempts}] {e}")
-            if before_retry_block:
-                try:
-                    before_retry_block()
-                except Exception as be:
-                    logger.warning(f"before_retry_block error: {be}")
-            time.sleep(delay)
+
+        ok = False
+        last_error = outcome.err
+        logger.error("[run_block retry %d/%d] %s", i, attempts, outcome.err)
+        if i == attempts:
+            break
+        if before_retry_block:
+            try:
+                before_retry_block()
+            except Exception as be:
+                logger.warning("before_retry_block error: %s", be)
+        _wait_document_ready(last_state.driver, _backoff(i, delay, max_delay, jitter))
 
     result = ScrapingResult(
-        duration=time.time() - start,
+        duration=(time.monotonic_ns() - start) / 1e9,
         successful=ok,
         error=last_error,
         warnings=list(last_state.warnings),
@@ -534,10 +1278,199 @@ def run_block(
     return last_state, result
 
 
+# -------------------------------------------------------------------
+# EJECUCIÓN PARALELA DE BLOQUES (UN FIREFOX POR PROCESO)
+# -------------------------------------------------------------------
+
+# Estado de cada proceso worker: un driver abierto en el initializer y reutilizado
+_WORKER: Dict[str, Any] = {}
+
+
+def portable_result(result: ScrapingResult) -> ScrapingResult:
+    """
+    Quita de last_result lo que no se puede serializar entre procesos (un WebElement).
+    """
+    if isinstance(result.last_result, WebElement):
+        return replace(result, last_result=None)
+    return result
+
+
+def failed_result(error: BaseException) -> ScrapingResult:
+    """
+    Resultado fallido para un bloque (o una cuenta) que no llegó a devolver el suyo.
+    """
+    return ScrapingResult(duration=0.0, successful=False, error=str(error), warnings=[], last_result=None)
+
+
+def _init_parallel_worker(
+    logger_name: str,
+    driver_path: str,
+    download_folder: Optional[str],
+    headless: bool,
+) -> None:
+    logger = getLogger(logger_name)
+    ctx = firefox_driver(logger, driver_path=driver_path, download_folder=download_folder, headless=headless)
+    _WORKER["driver"] = ctx.__enter__()
+    _WORKER["logger"] = logger
+    # Cierra el driver cuando el worker termina (atexit no corre en procesos hijos con fork)
+    Finalize(None, ctx.__exit__, args=(None, None, None), exitpriority=10)
+
+
+def _run_parallel_block(url: str, actions: List[ScrapingAction]) -> ScrapingResult:
+    logger = _WORKER["logger"]
+    state = pipe(DriverState(driver=_WORKER["driver"]), navigate(url), logger=logger)
+    _, result = run_block(state, actions, logger)
+    return portable_result(result)
+
+
+def run_blocks_parallel(
+    blocks: List[Tuple[str, List[ScrapingAction]]],
+    logger: Logger,
+    workers: int = 4,
+    driver_path: str = "geckodriver",
+    download_folder: Optional[str] = None,
+    headless: bool = True,
+) -> List[ScrapingResult]:
+    """
+    Ejecuta bloques independientes (url, acciones) en paralelo, un Firefox por proceso.
+    WebDriver no es thread-safe, pero cada proceso tiene su propia sesión.
+    Devuelve los ScrapingResult en el mismo orden que blocks.
+    Con GECKODRIVER_URL todos los workers irían al mismo geckodriver, que atiende una
+    sola sesión: se usa un único worker.
+    """
+    if os.getenv("GECKODRIVER_URL") and workers > 1:
+        logger.warning("GECKODRIVER_URL atiende una sola sesión: run_blocks_parallel usa 1 worker")
+        workers = 1
+    results: List[ScrapingResult] = []
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(blocks)) or 1,
+        initializer=_init_parallel_worker,
+        initargs=(logger.name, driver_path, download_folder, headless),
+    ) as pool:
+        futures = [pool.submit(_run_parallel_block, url, actions) for url, actions in blocks]
+        for (url, _), fut in zip(blocks, futures):
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                logger.error("[run_blocks_parallel] %s: %s", url, e)
+                results.append(failed_result(e))
+    return results
+
+
 # -------------------------------------------------------------------
 # OPCIONAL: ESPERAR DESCARGA (POR SI LO NECESITAS)
 # -------------------------------------------------------------------
 
+def _is_download_candidate(fname: str, file_name: Optional[str]) -> bool:
+    return not fname.endswith(".part") and (not file_name or file_name in fname)
+
+
+def _is_download_complete(src: str) -> bool:
+    # Firefox escribe en <nombre>.part y lo renombra al terminar: sin .part hermano, ya está completo
+    return os.path.isfile(src) and not os.path.exists(src + ".part") and os.path.getsize(src) > 0
+
+
+def _scan_complete_download(download_dir: str, file_name: Optional[str]) -> Optional[str]:
+    """
+    Un solo os.scandir: is_file() y stat() salen del DirEntry y el .part hermano
+    se busca entre los nombres ya listados, sin syscalls extra por archivo.
+    """
+    with os.scandir(download_dir) as it:
+        entries = list(it)
+    names = {e.name for e in entries}
+    for e in entries:
+        if (
+            _is_download_candidate(e.name, file_name)
+            and e.name + ".part" not in names
+            and e.is_file()
+            and e.stat().st_size > 0
+        ):
+            return e.path
+    return None
+
+
+def _wait_download_inotify(
+    download_dir: str,
+    timeout: int,
+    file_name: Optional[str],
+) -> Optional[str]:
+    """
+    Espera eventos IN_CLOSE_WRITE / IN_MOVED_TO en download_dir: el kernel avisa cuando
+    el archivo se cerró o se renombró (.part -> final), sin re-listar el directorio.
+    """
+    deadline = time.monotonic() + timeout
+    inotify = INotify()
+    try:
+        inotify.add_watch(download_dir, inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+
+        # Lo que ya terminó antes de registrar el watch no genera eventos
+        src = _scan_complete_download(download_dir, file_name)
+        if src is not None:
+            return src
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            for event in inotify.read(timeout=int(remaining * 1000)):
+                src = os.path.join(download_dir, event.name)
+                if _is_download_candidate(event.name, file_name) and _is_download_complete(src):
+                    return src
+    finally:
+        inotify.close()
+
+
+def _wait_download_watchdog(
+    download_dir: str,
+    timeout: int,
+    file_name: Optional[str],
+) -> Optional[str]:
+    """
+    Sin inotify (macOS/Windows): watchdog despierta la espera en cada cambio del
+    directorio y solo entonces se vuelve a escanear.
+    """
+    changed = threading.Event()
+
+    class _Handler(FileSystemEventHandler):
+        def on_any_event(self, event) -> None:
+            changed.set()
+
+    observer = Observer()
+    observer.schedule(_Handler(), download_dir, recursive=False)
+    observer.start()
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            src = _scan_complete_download(download_dir, file_name)
+            if src is not None:
+                return src
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            changed.wait(remaining)
+            changed.clear()
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def _wait_download_polling(
+    download_dir: str,
+    timeout: int,
+    file_name: Optional[str],
+) -> Optional[str]:
+    """
+    Fallback sin inotify: lista el directorio cada segundo hasta ver un archivo completo.
+    """
+    t0 = time.monotonic()
+    while time.monotonic() - t0 <= timeout:
+        src = _scan_complete_download(download_dir, file_name)
+        if src is not None:
+            return src
+        time.sleep(1)
+    return None
+
+
 def wait_for_download(
     download_dir: str,
     timeout: int,
@@ -546,42 +1479,35 @@ def wait_for_download(
     logger: Optional[Logger] = None,
 ) -> str:
     """
-    Espera a que un archivo en download_dir termine de descargarse (sin .part y tamaño estable).
+    Espera a que un archivo en download_dir termine de descargarse (sin .part y completo).
+    Usa inotify en Linux si inotify_simple está instalado, si no watchdog si está
+    instalado, y como último recurso sondea el directorio.
     """
     if move_to is not None and not os.path.isdir(move_to):
         os.makedirs(move_to)
 
-    t0 = time.time()
-    while time.time() - t0 <= timeout:
-        files = [
-            f for f in os.listdir(download_dir)
-            if os.path.isfile(os.path.join(download_dir, f)) and not f.endswith(".part")
-        ]
-        if file_name:
-            files = [f for f in files if file_name in f]
-
-        for fname in files:
-            src = os.path.join(download_dir, fname)
-            size1 = os.path.getsize(src)
-            time.sleep(1)
-            size2 = os.path.getsize(src)
-            if size1 == size2 and size2 > 0:
-                if move_to:
-                    dst = os.path.join(move_to, fname)
-                    try:
-                        shutil.move(src, dst)
-                        if logger:
-                            logger.info(f"Descarga movida a: {dst}")
-                        return dst
-                    except Exception as e:
-                        if logger:
-                            logger.warning(f"No se pudo mover {fname}: {e}")
-                        return src
-                else:
-                    if logger:
-                        logger.info(f"Descarga lista: {src}")
-                    return src
-
-        time.sleep(1)
+    if INotify is not None and sys.platform.startswith("linux"):
+        src = _wait_download_inotify(download_dir, timeout, file_name)
+    elif Observer is not None:
+        src = _wait_download_watchdog(download_dir, timeout, file_name)
+    else:
+        src = _wait_download_polling(download_dir, timeout, file_name)
+    if src is None:
+        raise TimeoutException("Timeout esperando descarga.")
+
+    if move_to:
+        fname = os.path.basename(src)
+        dst = os.path.join(move_to, fname)
+        try:
+            shutil.move(src, dst)
+            if logger:
+                logger.info("Descarga movida a: %s", dst)
+            return dst
+        except Exception as e:
+            if logger:
+                logger.warning("No se pudo mover %s: %s", fname, e)
+            return src
 
-    raise TimeoutException("Timeout esperando descarga.")
\ No newline at end of file
+    if logger:
+        logger.info("Descarga lista: %s", src)
+    return src
@@ -1,8 +1,12 @@
 # main.py
 from functions import (
-    firefox_driver, DriverState, ScrapingAction, By,
-    run_block, pipe, navigate, url_to_be
+    geckodriver_service, firefox_session, DriverState, ScrapingAction, ScrapingResult, By,
+    run_block, pipe, navigate, url_to_be, portable_result, failed_result
 )
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from typing import List, Optional, Tuple
+import argparse
 import logging
 import os
 from dotenv import load_dotenv
@@ -12,160 +16,237 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
 logger = logging.getLogger("functional-scraper")
 
-if __name__ == "__main__":
-    CC = os.getenv("CC")
-    PASS4 = os.getenv("PASSWORD")  # contraseña numérica para el teclado virtual
+LOGIN_URL = "https://login.sura.com/sso/servicelogin.aspx?continueTo=https%3A%2F%2Fsucursal.segurossura.com.co&service=clienteseguros"
+
+
+GECKODRIVER_PATH = "/Users/teoechavarria/Downloads/geckodriver"
+
+
+# Acciones estáticas: se arman una sola vez al importar. Las que dependen de la cuenta
+# (CC y contraseña) se completan por cuenta con with_credentials.
+LOGIN_ACTIONS: Tuple[ScrapingAction, ...] = (
+    ScrapingAction(
+        action_type="wait_visible",
+        description="Formulario principal",
+        locator_by=By.ID,
+        locator_path="aspnetForm",
+        timeout=25
+    ),
+    ScrapingAction(
+        action_type="form_fill",
+        description="Tipo de documento + número de identificación",
+        locator_by=By.CSS_SELECTOR,
+        locator_path={
+            "#ctl00_ContentMain_suraType": "C",  # CEDULA
+            "#suraName": "",  # se completa con la CC de cada cuenta
+        },
+        timeout=20,
+    ),
+    ScrapingAction(
+        action_type="js_kit",
+        description="Contraseña por teclado virtual (enfocar + teclear + aceptar)",
+        locator_by=By.CSS_SELECTOR,
+        locator_path="#suraPassword",
+        timeout=20,
+        keys_to_send=None,  # se completa con la contraseña de cada cuenta
+    ),
+    ScrapingAction(
+        action_type="click",
+        description="Iniciar sesión",
+        locator_by=By.ID,
+        locator_path="session-internet",
+        timeout=60,
+    ),
+)
 
-    logger.info(f"CC: {CC}")
-    logger.info(f"PASSWORD: {PASS4}")
+# Salud -> Citas de salud -> Pendientes + Reprogramar
+CITAS_ACTIONS: Tuple[ScrapingAction, ...] = (
+    # 1) Esperar a que aparezca el sura-modal
+    ScrapingAction(
+        action_type="wait_visible",
+        description="Modal principal de portal (sura-modal)",
+        locator_by=By.XPATH,
+        locator_path="/html/body/app-root/app-portal/sura-modal",
+        timeout=30
+    ),
+    # 2) Click en Salud
+    ScrapingAction(
+        action_type="click",
+        description="Selección módulo Salud",
+        locator_by=By.XPATH,
+        locator_path="//li[contains(@class,'list')]//button[.//span[contains(@class,'title') and normalize-space()='Salud']]",
+        timeout=30
+    ),
+    # 3) Click en botón 'Citas de salud'
+    ScrapingAction(
+        action_type="click",
+        description="Ir a Citas de salud",
+        locator_by=By.XPATH,
+        locator_path="//button[contains(@class,'item') and .//span[contains(normalize-space(),'Citas de salud')]]",
+        timeout=30
+    ),
+    # 4) Click en 'Citas pendientes'
+    ScrapingAction(
+        action_type="click",
+        description="Ir a Citas pendientes",
+        locator_by=By.ID,
+        locator_path="irCitasPendientes",
+        timeout=30
+    ),
+    # 5) Extraer fecha/hora de la primera cita pendiente (antes de salir del listado)
+    #    Usamos el contenedor .tarjetaCita__fecha
+    ScrapingAction(
+        action_type="extract_appointment_date",
+        description="Extraer fecha de primera cita pendiente",
+        locator_by=By.CSS_SELECTOR,
+        locator_path="div.tarjetaCita__fecha",
+        timeout=30
+    ),
+    # 6) Click en 'Reprogramar' de esa cita
+    ScrapingAction(
+        action_type="click",
+        description="Click en Reprogramar cita",
+        locator_by=By.ID,
+        locator_path="reagendarCita",
+        timeout=30
+    ),
+    # 7) Leer la fecha del TAB activo (reprogramación); batch_extract la junta con la
+    #    cita del paso 5 en last_result
+    ScrapingAction(
+        action_type="batch_extract",
+        description="Fecha del tab activo",
+        locator_by=By.CSS_SELECTOR,
+        locator_path={
+            "tab_date": "div.mdc-tab.mdc-tab--active[role='tab']",
+        },
+        timeout=30,
+    ),
+)
+
+
+def with_credentials(actions: Tuple[ScrapingAction, ...], cc: str, password: str) -> List[ScrapingAction]:
+    """
+    Copia las acciones con los datos de la cuenta: la CC en el form_fill
+    y la contraseña en el js_kit/keyboard_type. El resto se reutiliza tal cual.
+    """
+    filled = []
+    for action in actions:
+        if action.action_type == "form_fill":
+            action = replace(action, locator_path={**action.locator_path, "#suraName": cc})
+        elif action.action_type in ("keyboard_type", "js_kit"):
+            action = replace(action, keys_to_send=password)
+        filled.append(action)
+    return filled
 
-    LOGIN_URL = "https://login.sura.com/sso/servicelogin.aspx?continueTo=https%3A%2F%2Fsucursal.segurossura.com.co&service=clienteseguros"
 
-    with firefox_driver(logger, driver_path="/Users/teoechavarria/Downloads/geckodriver", download_folder="./downloads") as drv:
+def run_one(cc: str, password: str, service_url: str, login_url: str = LOGIN_URL) -> ScrapingResult:
+    """
+    Ejecuta el flujo completo (login + citas) para una cuenta en una sesión nueva
+    contra el geckodriver ya lanzado (service_url).
+    - password: contraseña numérica para el teclado virtual.
+    Devuelve un resultado serializable (se envía de vuelta al proceso principal).
+    """
+    logger.info("CC: %s", cc)
+
+    with firefox_session(logger, service_url, download_folder="./downloads", headless=True) as drv:
         state = DriverState(driver=drv)
 
         # Pipeline inicial: navega y valida URL
         state = pipe(
             state,
-            navigate(LOGIN_URL),
-            url_to_be(LOGIN_URL, timeout=30),
+            navigate(login_url),
+            url_to_be(login_url, timeout=30),
             logger=logger
         )
 
-        # Bloque de acciones
-        state, result = run_block(state, [
-            ScrapingAction(
-                action_type="wait_visible",
-                description="Formulario principal",
-                locator_by=By.ID,
-                locator_path="aspnetForm",
-                timeout=25
-            ),
-            ScrapingAction(
-                action_type="wait_visible",
-                description="Tab Asesor visible",
-                locator_by=By.ID,
-                locator_path="tabInternet",
-                timeout=25
-            ),
-            ScrapingAction(
-                action_type="select_option",
-                description="Tipo de documento",
-                locator_by=By.ID,
-                locator_path="ctl00_ContentMain_suraType",
-                timeout=15,
-                keys_to_send="C",  # CEDULA
-            ),
-            ScrapingAction(
-                action_type="safe_send_keys",
-                description="Número de identificación",
-                locator_by=By.ID,
-                locator_path="suraName",
-                timeout=20,
-                keys_to_send=CC,
-            ),
-            ScrapingAction(
-                action_type="focus_input",
-                description="Enfocar contraseña (abre teclado virtual)",
-                locator_by=By.ID,
-                locator_path="suraPassword",
-                timeout=20,
-            ),
-            ScrapingAction(
-                action_type="keyboard_type",
-                description="Teclear contraseña por teclado virtual",
-                locator_by=None,
-                locator_path=None,
-                timeout=20,
-                keys_to_send=PASS4,
-            ),
-            ScrapingAction(
-                action_type="keyboard_accept",
-                description="Aceptar teclado virtual",
-                locator_by=None,
-                locator_path=None,
-                timeout=15,
-            ),
-            ScrapingAction(
-                action_type="click",
-                description="Iniciar sesión",
-                locator_by=By.ID,
-                locator_path="session-internet",
-                timeout=60,
-            ),
-        ], logger)
-
-        logger.info(f"Resultado bloque -> OK={result.successful}, error={result.error}, warnings={result.warnings}")
-
-         # --- BLOQUE 2: SALUD -> CITAS DE SALUD -> PENDIENTES + REPROGRAMAR ---
-
-        state, citas_result = run_block(state, [
-            # 1) Esperar a que aparezca el sura-modal
-            ScrapingAction(
-                action_type="wait_visible",
-                description="Modal principal de portal (sura-modal)",
-                locator_by=By.XPATH,
-                locator_path="/html/body/app-root/app-portal/sura-modal",
-                timeout=30
-            ),
-            # 2) Click en Salud
-            ScrapingAction(
-                action_type="click",
-                description="Selección módulo Salud",
-                locator_by=By.XPATH,
-                locator_path="//li[contains(@class,'list')]//button[.//span[contains(@class,'title') and normalize-space()='Salud']]",
-                timeout=30
-            ),
-            # 3) Click en botón 'Citas de salud'
-            ScrapingAction(
-                action_type="click",
-                description="Ir a Citas de salud",
-                locator_by=By.XPATH,
-                locator_path="//button[contains(@class,'item') and .//span[contains(normalize-space(),'Citas de salud')]]",
-                timeout=30
-            ),
-            # 4) Click en 'Citas pendientes'
-            ScrapingAction(
-                action_type="click",
-                description="Ir a Citas pendientes",
-                locator_by=By.ID,
-                locator_path="irCitasPendientes",
-                timeout=30
-            ),
-            # 5) Extraer fecha de la primera cita pendiente
-            #    Usamos el contenedor .tarjetaCita__fecha
-            ScrapingAction(
-                action_type="extract_appointment_date",
-                description="Extraer fecha de primera cita pendiente",
-                locator_by=By.CSS_SELECTOR,
-                locator_path="div.tarjetaCita__fecha",
-                timeout=30
-            ),
-            # 6) Click en 'Reprogramar' de esa cita
-            ScrapingAction(
-                action_type="click",
-                description="Click en Reprogramar cita",
-                locator_by=By.ID,
-                locator_path="reagendarCita",
-                timeout=30
-            ),
-            # 7) Extraer la fecha del TAB activo (reprogramación)
-            ScrapingAction(
-                action_type="extract_tab_date",
-                description="Extraer fecha del día seleccionado (tab activo)",
-                locator_by=By.CSS_SELECTOR,
-                locator_path="div.mdc-tab.mdc-tab--active[role='tab']",
-                timeout=30
-            ),
-        ], logger)
-
-        logger.info(f"Citas bloque OK={citas_result.successful}, error={citas_result.error}")
-
-        # El resultado de la acción 5 (extract_appointment_date) y 7 (extract_tab_date)
-        # queda en citas_result.last_result (la ÚLTIMA acción, o sea el tab).
-        # Pero la fecha de la cita original se guardó en state.last justo después de la acción 5,
-        # así que es mejor hacer dos bloques o leerlo en el momento.
-        # Aquí, como ejemplo, lo recogemos desde la penúltima ejecución usando otra estrategia:
-        # más práctico: mirar en logs o, si prefieres, hacer dos bloques y usar ambas last_result.
-
-        logger.info(f"Último valor extraído (tab activo): {citas_result.last_result}")
\ No newline at end of file
+        # Bloque 1: login. Cada bloque reintenta por su cuenta: un fallo en citas
+        # no repite el login (ya hay sesión SSO y el formulario no volvería a aparecer)
+        state, login_result = run_block(state, with_credentials(LOGIN_ACTIONS, cc, password), logger)
+        logger.info(
+            "Login -> OK=%s, error=%s, warnings=%s",
+            login_result.successful, login_result.error, login_result.warnings,
+        )
+        if not login_result.successful:
+            return portable_result(login_result)
+
+        # Bloque 2: Salud -> Citas de salud -> Pendientes + Reprogramar
+        state, result = run_block(state, list(CITAS_ACTIONS), logger)
+        logger.info("Citas -> OK=%s, error=%s", result.successful, result.error)
+
+        # batch_extract deja ambas fechas en result.last_result:
+        # {"appointment": {"date": "...", "time": "..."}, "tab_date": "..."}
+        logger.info("Fechas extraídas: %s", result.last_result)
+        return portable_result(result)
+
+
+def run_many(
+    credentials: List[Tuple[str, str]],
+    login_url: str = LOGIN_URL,
+) -> List[Tuple[str, ScrapingResult]]:
+    """
+    Procesa varias cuentas en serie dentro de un proceso con un solo geckodriver:
+    cada cuenta abre su propia sesión (perfil limpio, sin cookies del SSO de la anterior)
+    y solo se paga el arranque de Firefox, no el de geckodriver.
+    """
+    results = []
+    try:
+        with geckodriver_service(logger, GECKODRIVER_PATH) as service_url:
+            for cc, password in credentials:
+                try:
+                    results.append((cc, run_one(cc, password, service_url, login_url)))
+                except Exception as e:
+                    logger.error("[%s] Error: %s", cc, e)
+                    results.append((cc, failed_result(e)))
+    except Exception as e:
+        # geckodriver no arrancó (o se cayó): las cuentas sin procesar quedan como fallidas
+        logger.error("geckodriver: %s", e)
+        done = {cc for cc, _ in results}
+        results.extend((cc, failed_result(e)) for cc, _ in credentials if cc not in done)
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Login en SURA y lectura de citas pendientes por cuenta.")
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WORKERS", "2")),
+        help="procesos en paralelo, cada uno con su geckodriver (default: WORKERS o 2; 1 con GECKODRIVER_URL)",
+    )
+    parser.add_argument("--login-url", default=LOGIN_URL, help="URL del SSO donde arranca el flujo")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    # Varias cuentas: CC y PASSWORD como listas separadas por comas, en el mismo orden
+    ccs = [c.strip() for c in os.getenv("CC", "").split(",")]
+    passwords = [p.strip() for p in os.getenv("PASSWORD", "").split(",")]
+    # Validar antes de lanzar Firefox: sin credenciales completas el login falla seguro
+    if not all(ccs) or not all(passwords) or len(ccs) != len(passwords):
+        raise SystemExit("Faltan credenciales: CC y PASSWORD deben tener el mismo número de valores (ver .env-example)")
+    credentials = list(zip(ccs, passwords))
+    workers = max(1, min(args.workers, len(credentials)))
+    if os.getenv("GECKODRIVER_URL") and workers > 1:
+        # Un geckodriver externo atiende una sola sesión: todas las cuentas van en serie
+        logger.warning("GECKODRIVER_URL definida: se usa 1 worker en lugar de %d", workers)
+        workers = 1
+
+    # Un proceso por worker, cada uno con su Firefox; las cuentas se reparten en round-robin
+    chunks = [credentials[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_many, chunk, args.login_url): chunk for chunk in chunks}
+        for fut in as_completed(futures):
+            try:
+                chunk_results = fut.result()
+            except Exception as e:
+                # El worker murió (ej: proceso terminado): no tapar los resultados de los demás
+                logger.error("Worker falló: %s", e)
+                chunk_results = [(cc, failed_result(e)) for cc, _ in futures[fut]]
+            for cc, result in chunk_results:
+                logger.info(
+                    "[%s] OK=%s, error=%s, resultado=%s",
+                    cc, result.successful, result.error, result.last_result,
+                )
+
+
+if __name__ == "__main__":
+    main()